@@ -65,7 +65,9 @@ class FfmpegDL:
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            universal_newlines=False,
+            bufsize=1,
+            encoding="utf-8",
+            errors="replace",
         )
 
     def convert(self, name: AnyStr, duration: float):
@@ -75,22 +77,19 @@ class FfmpegDL:
             task = progress.add_task(name, total=duration)
             self.load_subprocess()
 
-            stdout_line = None
-            prev_line = None
-            while True:
-                if self.proc.stdout is None:
+            # Block on whole lines until ffmpeg closes its output
+            last_line = None
+            for line in self.proc.stdout:
+                line = line.strip()
+                if not line:
                     continue
-                if stdout_line:
-                    prev_line = stdout_line
-                stdout_line = self.proc.stdout.readline().decode("utf-8", errors="replace").strip()
-                out_time_data = self.REGEX_OUT_TIME.search(stdout_line)
-                if out_time_data is not None:
-                    out_time = self.get_timedelta(out_time_data.group(1))
-                    progress.update(task, completed=out_time.total_seconds())
-                    continue
-                if not stdout_line and self.proc.poll() is not None:
-                    exit_code = self.proc.poll()
-                    if exit_code:
-                        raise FfmpegDLException(prev_line)
-                    else:
-                        break
+                last_line = line
+                # Only out_time= carries progress; skip the regex for the other -progress keys
+                if line.startswith("out_time="):
+                    out_time_data = self.REGEX_OUT_TIME.match(line)
+                    if out_time_data is not None:
+                        out_time = self.get_timedelta(out_time_data.group(1))
+                        progress.update(task, completed=out_time.total_seconds())
+
+            if self.proc.wait():
+                raise FfmpegDLException(last_line)
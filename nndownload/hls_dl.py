@@ -1,54 +1,241 @@
 """Native HLS downloader for DMS streams."""
 
+import json
+import os
 import re
-from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import unpad
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
-M3U8_KEY_RE = re.compile(r"((?:#EXT-X-KEY)(?:.*),?URI=\")(?P<url>.*)\",IV=0x(?P<iv>.*)")
-M3U8_MAP_RE = re.compile(r"((?:#EXT-X-MAP)(?:.*),?URI=\")(?P<url>.*)\"(.*)")
-M3U8_SEGMENT_RE = re.compile(r"(?:#EXTINF):.*\n(.*)")
+M3U8_ATTRIBUTE_RE = re.compile(r"([A-Z0-9-]+)=(\"[^\"]*\"|[^,]*)")
 
+SEGMENT_CHUNK_SIZE = 64 * 1024
+AES_BLOCK_BYTES = algorithms.AES.block_size // 8
+WRITEV_MAX_BUFFERS = 1024  # IOV_MAX on Linux and macOS
+ADAPTIVE_START_SEGMENTS = 4  # In-flight segment requests before any throughput is measured
+ADAPTIVE_MAX_SEGMENTS = 16
+ADAPTIVE_WINDOW_S = 2
+ADAPTIVE_INCREASE_RATIO = 1.05  # Add a request when throughput grows by at least 5%
+ADAPTIVE_DECREASE_RATIO = 0.9  # Halve requests when throughput drops by at least 10%
 
-def download_hls(m3u8_url, filename, name, session, progress, threads):
-    """Perform a native HLS download of a provided M3U8 manifest."""
+
+class SegmentConcurrency:
+    """Limit in-flight segment requests, adjusting the limit to measured throughput."""
+
+    def __init__(self, limit, minimum, maximum):
+        self.limit = limit
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.condition = threading.Condition()
+        self.window_start = time.monotonic()
+        self.window_bytes = 0
+        self.last_rate = 0
+
+    def __enter__(self):
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+
+    def __exit__(self, *exc_info):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def record(self, byte_count):
+        """Count received bytes and adjust the limit once per sampling window."""
+
+        with self.condition:
+            self.window_bytes += byte_count
+            now = time.monotonic()
+            elapsed = now - self.window_start
+            if elapsed < ADAPTIVE_WINDOW_S:
+                return
+
+            rate = self.window_bytes / elapsed
+            if rate >= self.last_rate * ADAPTIVE_INCREASE_RATIO:
+                self.limit = min(self.limit + 1, self.maximum)
+                self.condition.notify()
+            elif rate <= self.last_rate * ADAPTIVE_DECREASE_RATIO:
+                self.limit = max(self.limit // 2, self.minimum)
+            self.last_rate = rate
+            self.window_start = now
+            self.window_bytes = 0
+
+
+def format_not_available(message):
+    """Create the downloader's FormatNotAvailableException, which cannot be imported at load time without a circular import."""
 
     from .nndownload import FormatNotAvailableException
+    return FormatNotAvailableException(message)
+
+
+def parse_m3u8_attributes(line):
+    """Return the attribute list of an M3U8 tag line as a dictionary with quotes removed."""
+
+    return {name: value.strip("\"") for name, value in M3U8_ATTRIBUTE_RE.findall(line.split(":", 1)[1])}
+
+
+def read_resume_state(filename, state_filename, stream_id, segment_count):
+    """Read the number of completed segments and bytes written from a previous run of the same stream, if any."""
+
+    if not os.path.isfile(filename):
+        return 0, 0
+    try:
+        with open(state_filename, "r", encoding="utf-8") as state_file:
+            state = json.load(state_file)
+        # Segment and key URLs are signed per session, so compare the requested stream and the playlist shape instead
+        if state["stream"] == stream_id and state["segments"] == segment_count and os.path.getsize(filename) >= state["size"]:
+            return state["completed"], state["size"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return 0, 0
+
+
+def write_resume_state(state_filename, stream_id, segment_count, completed, size):
+    """Atomically record the number of completed segments and bytes written."""
+
+    temp_filename = state_filename + ".tmp"
+    with open(temp_filename, "w", encoding="utf-8") as state_file:
+        json.dump({"stream": stream_id, "segments": segment_count, "completed": completed, "size": size}, state_file)
+    os.replace(temp_filename, state_filename)
+
+
+def write_segments(file, buffers):
+    """Write consecutive segments to an unbuffered file, using one vectored write where the platform supports it."""
+
+    if not hasattr(os, "writev"):
+        # A raw write may be short, so keep writing the remainder of each buffer
+        for buffer in buffers:
+            buffer = memoryview(buffer)
+            while buffer:
+                buffer = buffer[file.write(buffer):]
+        return
+
+    buffers = [memoryview(buffer) for buffer in buffers]
+    while buffers:
+        written = os.writev(file.fileno(), buffers[:WRITEV_MAX_BUFFERS])
+        # Drop fully written buffers and trim a partially written one before retrying
+        while buffers and written >= len(buffers[0]):
+            written -= len(buffers.pop(0))
+        if written:
+            buffers[0] = buffers[0][written:]
+
+
+def download_hls(m3u8_url, filename, name, session, progress, threads, stream_id):
+    """Perform a native HLS download of a provided M3U8 manifest, identified across runs by a stream ID such as its quality."""
 
     with session.get(m3u8_url) as m3u8_request:
         m3u8_request.raise_for_status()
         m3u8 = m3u8_request.text
-    key_match = M3U8_KEY_RE.search(m3u8)
-    init_match = M3U8_MAP_RE.search(m3u8)
-    segments = M3U8_SEGMENT_RE.findall(m3u8)
-    if not key_match:
-        raise FormatNotAvailableException("Could not retrieve key file from manifest")
-    if not init_match:
-        raise FormatNotAvailableException("Could not retrieve init file from manifest")
+    # Collect the init section and segments in one pass, tracking the key in effect and the media sequence
+    # number so each segment is paired with its own key and IV; URI lines are the only untagged lines in a media playlist
+    init_url = None
+    segments = []
+    segment_key = None
+    key_algorithms = {}
+    sequence = 0
+    for line in m3u8.splitlines():
+        if not line:
+            continue
+        if not line.startswith("#"):
+            if not segment_key:
+                raise format_not_available("Could not retrieve key file from manifest")
+            cipher_algorithm, iv = segment_key
+            # Without an explicit IV, the media sequence number is used as a 128-bit big-endian IV
+            segments.append((line, cipher_algorithm, iv or sequence.to_bytes(AES_BLOCK_BYTES, "big")))
+            sequence += 1
+        elif line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-KEY:"):
+            key_attributes = parse_m3u8_attributes(line)
+            if key_attributes.get("METHOD") != "AES-128":
+                raise format_not_available("Unsupported HLS encryption method \"{0}\"".format(key_attributes.get("METHOD")))
+            key_url = key_attributes["URI"]
+            if key_url not in key_algorithms:
+                with session.get(key_url) as key_request:
+                    key_request.raise_for_status()
+                    # Validate each key once; segments only bind their own CBC state to it
+                    key_algorithms[key_url] = algorithms.AES(key_request.content)
+            iv = bytes.fromhex(key_attributes["IV"][2:]) if "IV" in key_attributes else None
+            segment_key = (key_algorithms[key_url], iv)
+        elif init_url is None and line.startswith("#EXT-X-MAP:"):
+            init_url = parse_m3u8_attributes(line).get("URI")
+    if not init_url:
+        raise format_not_available("Could not retrieve init file from manifest")
     if not segments:
-        raise FormatNotAvailableException("Could not retrieve segments from manifest")
-
-    key_url = key_match["url"]
-    with session.get(key_url) as key_request:
-        key_request.raise_for_status()
-        key = key_request.content
-    iv = key_match["iv"]
-    iv = bytes.fromhex(iv)
-    init_url = init_match["url"]
-    with open(filename, "wb") as f:
-        f.write(session.get(init_url).content)
-
-    def download_segment(segment):
-        with session.get(segment) as r:
+        raise format_not_available("Could not retrieve segments from manifest")
+
+    def download_init():
+        with session.get(init_url) as init_request:
+            init_request.raise_for_status()
+            return init_request.content
+
+    def download_segment(segment_task):
+        segment, cipher_algorithm, iv = segment_task
+        decryptor = Cipher(cipher_algorithm, modes.CBC(iv)).decryptor()
+        decrypted_len = 0
+        # Decrypt each chunk as it arrives into one buffer sized from the response, growing it only if the length was missing
+        with concurrency, session.get(segment, stream=True) as r:
             r.raise_for_status()
-            cipher = AES.new(key, AES.MODE_CBC, iv=iv)
-            return unpad(cipher.decrypt(r.content), AES.block_size)
-
-    task_id = progress.add_task(name, total=len(segments))
-    with ThreadPoolExecutor(max_workers=threads) as executor:
-        results = executor.map(download_segment, segments)
-        for decrypted in results:
-            with open(filename, "ab") as f:
-                f.write(decrypted)
-            progress.advance(task_id)
+            decrypted = bytearray(int(r.headers.get("content-length", 0)) + AES_BLOCK_BYTES - 1)
+            for chunk in r.iter_content(SEGMENT_CHUNK_SIZE):
+                shortfall = decrypted_len + len(chunk) + AES_BLOCK_BYTES - 1 - len(decrypted)
+                if shortfall > 0:
+                    decrypted.extend(bytes(shortfall))
+                decrypted_len += decryptor.update_into(chunk, memoryview(decrypted)[decrypted_len:])
+                concurrency.record(len(chunk))
+        decryptor.finalize()
+
+        # PKCS#7: the final byte gives the padding length, and every padding byte repeats it
+        pad_len = decrypted[decrypted_len - 1] if decrypted_len else 0
+        if not 1 <= pad_len <= AES_BLOCK_BYTES or decrypted[decrypted_len - pad_len:decrypted_len] != bytes((pad_len,)) * pad_len:
+            raise ValueError("Invalid padding bytes.")
+        return memoryview(decrypted)[:decrypted_len - pad_len]
+
+    # Segments are written in order, so a count and a byte offset are enough to resume
+    state_filename = filename + ".json"
+    completed, size = read_resume_state(filename, state_filename, stream_id, len(segments))
+
+    task_id = progress.add_task(name, total=len(segments), completed=completed)
+    # Hold the output open for the whole download; segments are written in order as they complete
+    # Unbuffered, since completed runs of segments are written with a single vectored write
+    with open(filename, "r+b" if completed else "wb", buffering=0) as f:
+        if completed:
+            f.truncate(size)
+            f.seek(size)
+
+        # A requested thread count is used as-is; otherwise find one from the measured throughput
+        if threads:
+            concurrency = SegmentConcurrency(threads, threads, threads)
+        else:
+            concurrency = SegmentConcurrency(ADAPTIVE_START_SEGMENTS, 1, ADAPTIVE_MAX_SEGMENTS)
+
+        with ThreadPoolExecutor(max_workers=concurrency.maximum) as executor:
+            # Fetch the init section alongside the first segments; only its write has to come first
+            init_future = None if completed else executor.submit(download_init)
+            segment_futures = {executor.submit(download_segment, segment): index for index, segment in enumerate(segments[completed:], completed)}
+            # Hold segments that finish out of order until every earlier one has been written
+            pending = {}
+            try:
+                if init_future:
+                    write_segments(f, [init_future.result()])
+                for segment_future in as_completed(segment_futures):
+                    pending[segment_futures[segment_future]] = segment_future.result()
+                    progress.advance(task_id)
+                    if completed in pending:
+                        ready = []
+                        while completed in pending:
+                            ready.append(pending.pop(completed))
+                            completed += 1
+                        write_segments(f, ready)
+                        write_resume_state(state_filename, stream_id, len(segments), completed, f.tell())
+            finally:
+                # Drop queued segments if one failed
+                for segment_future in segment_futures:
+                    segment_future.cancel()
+
+    os.remove(state_filename)
@@ -2,27 +2,29 @@
 
 import argparse
 import asyncio
-import collections
-import contextlib
+import functools
 import getpass
+import html
 import json
 import logging
 import math
 import mimetypes
 import netrc
 import os
-import random
 import re
 import shutil
 import string
 import sys
-import tempfile
 import threading
 import time
-import xml.dom.minidom
+import weakref
+import xml.etree.ElementTree
+import xml.sax.saxutils
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, as_completed, wait
 from typing import AnyStr, List, Match
 
 import aiohttp
+import orjson
 import requests
 from aiohttp_socks import ProxyConnector
 from bs4 import BeautifulSoup
@@ -34,7 +36,7 @@ from urllib3.util import Retry
 from urllib.parse import urlparse
 
 from .ffmpeg_dl import FfmpegDL, FfmpegDLException, FfmpegExistsException
-from .hls_dl import download_hls
+from .hls_dl import download_hls, parse_m3u8_attributes
 
 __version__ = "1.18"
 __author__ = "Alex Aplin"
@@ -71,12 +73,37 @@ USER_CONTENT_TYPE = r"(video|mylist|live|blomaga|list|series|follow)"
 VALID_URL_RE = re.compile(r"https?://(?:(?:(?:(ch|sp|www|seiga|manga)\.)|(?:(live[0-9]?|cas)\.))?"
                           rf"(?:(?:nicovideo\.jp/{CONTENT_TYPE}?)(?(3)/|))|(nico\.ms)/)"
                           rf"((?:(?:[a-z]{2})?\d+)|[a-zA-Z0-9-]+?)/?(?:/{USER_CONTENT_TYPE})?"
-                          r"(?(6)/((?:[a-z]{2})?\d+))?(?:\?(?:user_id=(.*)|.*)?)?$")
-M3U8_STREAM_RE = re.compile(r"(?:(?:#EXT-X-STREAM-INF)|#EXT-X-I-FRAME-STREAM-INF):.*(?:BANDWIDTH=(\d+)).*\n(.*)")
-M3U8_MEDIA_RE = re.compile(r"(?:#EXT-X-MEDIA:TYPE=)(?:(\w+))(?:.*),URI=\"(.*)\"")
+                          r"(?(6)/((?:[a-z]{2})?\d+))?(?:\?(?:user_id=(.*)|.*)?)?")
+M3U8_CLIP_RE = re.compile(r"(?:#EXTINF):.*\n(.*)")
+SERVER_RESPONSE_RE = re.compile(r"<meta name=\"server-response\" content=\"([^\"]+)\"")
 SEIGA_DRM_KEY_RE = re.compile(r"/image/([a-z0-9]+)")
 SEIGA_USER_ID_RE = re.compile(r"user_id=(\d+)")
 SEIGA_MANGA_ID_RE = re.compile(r"/comic/(\d+)")
+SEIGA_IMAGE_PATH_RE = re.compile(r"^/seiga/")
+CHANNEL_VIDEO_URL_RE = re.compile(r"^https://www\.nicovideo\.jp/watch/")
+
+ILLEGAL_PATH_CHARACTERS = "<>\"?\\/*:|"
+SANITIZE_PATH_TABLE = str.maketrans(dict.fromkeys(ILLEGAL_PATH_CHARACTERS, " "))
+
+ARTICLE_MARKDOWN_REPLACEMENTS = {
+    "<br/>": "\n",
+    "<br>": "\n",
+    "</br>": "",
+    "<p>": "\n",
+    "</p>": "\n",
+    "<hr/>": "---\n",
+    "<strong>": "**",
+    "</strong>": "**",
+    "<h2>": "\n## ",
+    "</h2>": "\n",
+    "<h3>": "\n### ",
+    "</h3>": "\n",
+    "<ul>": "",
+    "</ul>": "",
+    "<li>": "- ",
+    "</li>": "\n",
+}
+ARTICLE_MARKDOWN_RE = re.compile("|".join(map(re.escape, ARTICLE_MARKDOWN_REPLACEMENTS)))
 
 THUMB_INFO_API = "http://ext.nicovideo.jp/api/getthumbinfo/{0}"
 MYLIST_API = "https://nvapi.nicovideo.jp/v2/mylists/{0}?pageSize=500"  # 500 video limit for premium mylists
@@ -89,7 +116,6 @@ USER_SERIES_API = "https://nvapi.nicovideo.jp/v1/users/{0}/series"
 USER_FOLLOWING_API = "https://nvapi.nicovideo.jp/v1/users/{0}/following/users?pageSize=800" # 800 following limit for premium users
 SEIGA_MANGA_TAGS_API = "https://seiga.nicovideo.jp/ajax/manga/tag/list?id={0}"
 COMMENTS_API = "https://public.nvcomment.nicovideo.jp/v1/threads"
-COMMENTS_API_POST_DATA = "{{\'params\':{0},\'threadKey\':\'{1}\',\'additionals\':{{}}}}"
 USER_HISTORY_API = "https://nvapi.nicovideo.jp/v1/users/me/watch/history?page={0}&pageSize={1}"
 USER_LIKES_API = "nvapi.nicovideo.jp/v1/users/me/watch/likes?page={0}&pageSize={1}"
 USER_WATCHLATER_API = "https://nvapi.nicovideo.jp/v1/users/me/watch-later?sortKey=addedAt&sortOrder=desc&pageSize={0}&page={1}"
@@ -99,16 +125,21 @@ REGION_LOCK_ERRORS = {  "お住まいの地域・国からは視聴すること
                      }
 
 USER_VIDEOS_API_N = 100
+PAGE_REQUEST_WORKERS = 4  # Concurrent page requests once a paginated list's total is known
+IMAGE_REQUEST_WORKERS = 4  # Concurrent image requests for a Seiga chapter unless --threads is given
+MANGA_CHAPTER_WORKERS = 2  # Concurrent chapters for a Seiga manga, kept low since each also requests its images concurrently
 NAMA_HEARTBEAT_INTERVAL_S = 30
 NAMA_PLAYLIST_INTERVAL_S = 5
 DMC_HEARTBEAT_INTERVAL_S = 15
+PROGRESS_INTERVAL_S = 0.25
 KILOBYTE = 1024
 KILOBIT = 1000
-BLOCK_SIZE = 1024
+BLOCK_SIZE = 256 * KILOBYTE
 EPSILON = 0.0001
 RETRY_ATTEMPTS = 5
 BACKOFF_FACTOR = 2  # retry_timeout_s = BACKOFF_FACTOR * (2 ** ({RETRY_ATTEMPTS} - 1))
-TEMP_PATH_LEN = 16
+POOL_CONNECTIONS = 16  # Number of hosts to keep connection pools for
+POOL_MAXSIZE = 64  # Keep-alive connections per host, enough for concurrent segment and part workers
 
 MIMETYPES = {
     "image/gif": "gif",
@@ -221,11 +252,16 @@ dl_group.add_argument("-s", "--skip-media", action="store_true", dest="skip_medi
 dl_group.add_argument("--break-on-existing", action="store_true", dest="break_on_existing", help="break after encountering an existing download")
 dl_group.add_argument("--playlist-start", dest="playlist_start", metavar="N", type=int, default=0,
                       help="specify the index to start a list of items from (begins at 0)")
+dl_group.add_argument("--mylist-concurrency", dest="mylist_concurrency", metavar="N", type=int,
+                      help="download a specified number of mylist videos at once")
 
 # Globals
 
 _START_TIME = _PROGRESS = 0
 _CMDL_OPTS = None
+_OUTPUT_LOCK = threading.Lock()
+_PROGRESS_LOCK = threading.Lock()
+_PREFLIGHTED_APIS = weakref.WeakKeyDictionary()  # APIs already preflighted, per session
 
 
 class AuthenticationException(Exception):
@@ -282,8 +318,9 @@ def output(out_str: AnyStr, level=logging.INFO, force: bool = False):
         logger.log(level, out_str.strip("\n"))
 
     if not _CMDL_OPTS.quiet or force:
-        sys.stdout.write(out_str)
-        sys.stdout.flush()
+        with _OUTPUT_LOCK:
+            sys.stdout.write(out_str)
+            sys.stdout.flush()
 
 
 def format_value(value: int, custom_type: str = "B", use_bits: bool = False):
@@ -292,14 +329,19 @@ def format_value(value: int, custom_type: str = "B", use_bits: bool = False):
     base = KILOBIT if use_bits else KILOBYTE
 
     try:
-        exponent = int(math.log(value, base))
-        suffix = "\0KMGTPE"[exponent]
+        if use_bits:
+            exponent = max(len(str(int(value))) - 1, 0) // 3  # Integer log base 1000 from the decimal digit count
+            scale = base ** exponent
+        else:
+            exponent = max(int(value).bit_length() - 1, 0) // 10  # Integer log base 1024
+            scale = 1 << (10 * exponent)
+        suffix = " KMGTPE"[exponent]
         suffix = suffix.lower() if use_bits else suffix
 
         if exponent == 0:
-            return "{0}{1}".format(value, suffix)
+            return "{0}{1}".format(int(value), custom_type)
 
-        converted = float(value / base ** exponent)
+        converted = float(value / scale)
         return "{0:.2f}{1}{2}".format(converted, suffix, custom_type) if not use_bits else "{0}{1}{2}".format(converted, suffix, custom_type)
 
     except IndexError as exception:
@@ -315,6 +357,15 @@ def calculate_speed(start, now, prog_bytes):
     return format_value(prog_bytes / dif)
 
 
+def output_progress(progress_bytes: int, total_bytes: int, start_time: float):
+    """Print a progress bar and the current download speed."""
+
+    done = 25 * progress_bytes // total_bytes
+    percent = 100 * progress_bytes // total_bytes
+    speed_str = calculate_speed(start_time, time.time(), progress_bytes)
+    output("\r|{0}{1}| {2}/100 @ {3:9}/s".format("#" * done, " " * (25 - done), percent, speed_str), logging.DEBUG)
+
+
 def replace_extension(filename: AnyStr, new_extension: AnyStr):
     """Replace the extension in a file path."""
 
@@ -325,7 +376,30 @@ def replace_extension(filename: AnyStr, new_extension: AnyStr):
 def sanitize_for_path(value: AnyStr, replace: AnyStr = ' '):
     """Remove potentially illegal characters from a path."""
 
-    return re.sub(r'[<>\"\?\\/\*:|]', replace, value).strip()
+    table = SANITIZE_PATH_TABLE if replace == " " else str.maketrans(dict.fromkeys(ILLEGAL_PATH_CHARACTERS, replace))
+    return value.translate(table).strip()
+
+
+class TemplateDict(dict):
+    """Output template values that substitute a placeholder for missing fields."""
+
+    __slots__ = ()
+
+    def __missing__(self, key):
+        return "__NONE__"
+
+
+@functools.lru_cache(maxsize=None)
+def get_template_fields(template: AnyStr) -> frozenset:
+    """Return the top-level field names referenced by an output template, including any nested in format specs."""
+
+    fields = set()
+    for _, field_name, format_spec, _ in string.Formatter().parse(template):
+        if field_name is not None:
+            fields.add(re.match(r"[^.\[]*", field_name)[0])
+        if format_spec:
+            fields |= get_template_fields(format_spec)
+    return frozenset(fields)
 
 
 def create_filename(template_params: dict, is_comic: bool = False):
@@ -334,9 +408,9 @@ def create_filename(template_params: dict, is_comic: bool = False):
     filename_template = _CMDL_OPTS.output_path
 
     if filename_template:
-        template_dict = dict(template_params)
-        template_dict = dict((k, sanitize_for_path(str(v))) for k, v in template_dict.items() if v)
-        template_dict = collections.defaultdict(lambda: "__NONE__", template_dict)
+        # Only sanitize the fields the template actually references
+        template_fields = get_template_fields(filename_template)
+        template_dict = TemplateDict((k, sanitize_for_path(str(v))) for k, v in template_params.items() if v and k in template_fields)
 
         filename = filename_template.format_map(template_dict).strip()
         if is_comic:
@@ -355,8 +429,7 @@ def create_filename(template_params: dict, is_comic: bool = False):
         return directory
 
     else:
-        filename = "{0} - {1}.{2}".format(template_params["id"], template_params["title"], template_params["ext"])
-        return sanitize_for_path(filename)
+        return "{0} - {1}.{2}".format(template_params["id"], sanitize_for_path(template_params["title"]), template_params["ext"])
 
 
 def read_file(session: requests.Session, file: AnyStr):
@@ -369,7 +442,7 @@ def read_file(session: requests.Session, file: AnyStr):
     for index, line in enumerate(content):
         try:
             output("{0}/{1}\n".format(index + 1, total_lines), logging.INFO)
-            url_mo = VALID_URL_RE.match(line)
+            url_mo = VALID_URL_RE.fullmatch(line.strip())
             if url_mo is None:
                 raise ArgumentException("URL argument is not of a known or accepted type of Nico URL")
             process_url_mo(session, url_mo)
@@ -379,35 +452,36 @@ def read_file(session: requests.Session, file: AnyStr):
             continue
 
 
-def get_media_from_manifest(manifest_text: AnyStr, media_type: AnyStr) -> AnyStr:
-    """Return the first seen media match for a given type from a .m3u8 manifest."""
-
-    media_type = media_type.capitalize()
-    match = M3U8_MEDIA_RE.search(manifest_text)
+def parse_master_manifest(manifest_text: AnyStr) -> tuple:
+    """Return the highest quality stream and the first media URI of each type from a .m3u8 master manifest."""
 
-    if not match:
-        raise FormatNotAvailableException("Could not retrieve media playlist from manifest")
+    best_bandwidth, best_stream = -1, None
+    media_uris = {}
+    stream_bandwidth = None
+    for line in manifest_text.splitlines():
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            stream_bandwidth = int(parse_m3u8_attributes(line).get("BANDWIDTH", 0))
+        elif line.startswith("#EXT-X-MEDIA:"):
+            media_attributes = parse_m3u8_attributes(line)
+            if "URI" in media_attributes:
+                media_uris.setdefault(media_attributes.get("TYPE"), media_attributes["URI"])
+        # The stream URI is the next untagged line after its #EXT-X-STREAM-INF tag
+        elif stream_bandwidth is not None and line and not line.startswith("#"):
+            if stream_bandwidth > best_bandwidth:
+                best_bandwidth, best_stream = stream_bandwidth, line
+            stream_bandwidth = None
 
-    media_url = match[2]
-    return media_url
+    return best_stream, media_uris
 
 
 def get_stream_from_manifest(manifest_text: AnyStr) -> AnyStr:
     """Return the highest quality stream from a .m3u8 manifest."""
 
-    best_bandwidth, best_stream = -1, None
-    matches = M3U8_STREAM_RE.findall(manifest_text)
+    best_stream, _ = parse_master_manifest(manifest_text)
 
-    if not matches:
+    if not best_stream:
         raise FormatNotAvailableException("Could not retrieve stream playlist from manifest")
 
-    else:
-        for match in matches:
-            stream_bandwidth = int(match[0])
-            if stream_bandwidth > best_bandwidth:
-                best_bandwidth = stream_bandwidth
-                best_stream = match[1]
-
     return best_stream
 
 
@@ -420,13 +494,18 @@ def find_extension(mimetype: AnyStr) -> AnyStr:
 def generic_dl_request(session: requests.Session, uri: AnyStr, filename: AnyStr, binary: bool=False):
     """Generic request to download and write to file."""
 
-    request = session.get(uri)
-    request.raise_for_status()
-    request_body = request.content if binary else request.text
-    mode = "wb" if binary else "w"
-    with open(filename, mode) as file:
-        file.write(request_body)
-    return request_body
+    with session.get(uri, stream=True) as request:
+        request.raise_for_status()
+        if binary:
+            with open(filename, "wb") as file:
+                for block in request.iter_content(BLOCK_SIZE):
+                    file.write(block)
+        else:
+            # Decoding needs a known charset; fall back to UTF-8 rather than buffering the body to guess one
+            request.encoding = request.encoding or "utf-8"
+            with open(filename, "w", encoding="utf-8") as file:
+                for block in request.iter_content(BLOCK_SIZE, decode_unicode=True):
+                    file.write(block)
 
 
 def rewrite_file(filename: AnyStr, old_str: AnyStr, new_str: AnyStr):
@@ -440,15 +519,29 @@ def rewrite_file(filename: AnyStr, old_str: AnyStr, new_str: AnyStr):
         file.truncate()
 
 
-@contextlib.contextmanager
-def get_temp_dir():
-    """Get a temporary working directory."""
+def send_preflight(session: requests.Session, api: AnyStr, url: AnyStr, headers: dict = None):
+    """Send an OPTIONS request ahead of an API call, once per API for the session."""
 
-    tmpdir = tempfile.mkdtemp()
-    try:
-        yield tmpdir
-    finally:
-        shutil.rmtree(tmpdir)
+    # Like a browser's preflight cache, one request per API is enough; repeating it only adds a round trip
+    preflighted_apis = _PREFLIGHTED_APIS.setdefault(session, set())
+    if api in preflighted_apis:
+        return
+    session.options(url, headers=headers)
+    preflighted_apis.add(api)
+
+
+def preallocate_file(filename: AnyStr, length: int):
+    """Create a file and reserve disk space for its full length."""
+
+    with open(filename, "wb") as file:
+        # Reserve real extents where supported rather than creating a sparse file
+        if hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(file.fileno(), 0, length)
+                return
+            except OSError:
+                pass
+        file.truncate(length)
 
 
 ## Nama methods
@@ -478,7 +571,7 @@ async def download_stream_clips(session: requests.Session, stream_url: AnyStr):
         stream_request.raise_for_status()
         # stream_length = re.search(r"(?:#STREAM-DURATION:)(.*)", stream_request.text)[1]
 
-        clip_matches = re.compile(r"(?:#EXTINF):.*\n(.*)").findall(stream_request.text)
+        clip_matches = M3U8_CLIP_RE.findall(stream_request.text)
         if not clip_matches:
             raise FormatNotAvailableException("Could not retrieve stream clips from playlist")
 
@@ -494,8 +587,10 @@ async def download_stream_clips(session: requests.Session, stream_url: AnyStr):
 async def perform_nama_heartbeat(websocket: aiohttp.ClientWebSocketResponse, watching_frame: dict):
     """Send a watching frame periodically to keep the stream alive."""
 
+    # Serialize once; the same frame is sent for the life of the connection
+    watching_message = orjson.dumps(watching_frame).decode()
     while True:
-        await websocket.send_str(json.dumps(watching_frame))
+        await websocket.send_str(watching_message)
         # output("Sending watching frame.\n", logging.DEBUG)
         await asyncio.sleep(NAMA_HEARTBEAT_INTERVAL_S)
 
@@ -511,8 +606,9 @@ async def open_nama_websocket(
     connector = ProxyConnector.from_url(proxy) if proxy else None
     async with aiohttp.ClientSession(connector=connector) as websocket_session:
         async with websocket_session.ws_connect(uri) as websocket:
-            await websocket.send_str(json.dumps(NAMA_PERMIT_FRAME))
+            await websocket.send_str(orjson.dumps(NAMA_PERMIT_FRAME).decode())
             heartbeat = event_loop.create_task(perform_nama_heartbeat(websocket, NAMA_WATCHING_FRAME))
+            pong_message = orjson.dumps(PONG_FRAME).decode()
 
             try:
                 while True:
@@ -527,7 +623,7 @@ async def open_nama_websocket(
                     if message.type != aiohttp.WSMsgType.TEXT:
                         continue
 
-                    frame = json.loads(message.data)
+                    frame = orjson.loads(message.data)
                     frame_type = frame["type"]
 
                     # output("SERVER: {0}\n".format(frame), logging.DEBUG)
@@ -554,7 +650,7 @@ async def open_nama_websocket(
 
                     elif frame_type == "ping":
                         # output("Responding to ping frame.\n", logging.DEBUG)
-                        await websocket.send_str(json.dumps(PONG_FRAME))
+                        await websocket.send_str(pong_message)
 
             finally:
                 heartbeat.cancel()
@@ -577,7 +673,7 @@ def reserve_timeshift(session: requests.Session, nama_id: AnyStr) -> AnyStr:
     nama_request.raise_for_status()
 
     nama_document = BeautifulSoup(nama_request.text, "html.parser")
-    params = json.loads(nama_document.find(id="embedded-data")["data-props"])
+    params = orjson.loads(nama_document.find(id="embedded-data")["data-props"])
     websocket_url = params["site"]["relive"]["webSocketUrl"]
     if not websocket_url:
         raise FormatNotAvailableException("Failed to use timeshift ticket")
@@ -593,25 +689,29 @@ def request_nama(session: requests.Session, nama_id: AnyStr):
 
     nama_document = BeautifulSoup(nama_request.text, "html.parser")
 
-    if nama_document.find(id="embedded-data"):
-        params = json.loads(nama_document.find(id="embedded-data")["data-props"])
+    embedded_data = nama_document.find(id="embedded-data")
+    if embedded_data:
+        params = orjson.loads(embedded_data["data-props"])
 
         rejection_errors = params["userProgramWatch"]["rejectedReasons"]
         if rejection_errors:
             raise ParameterExtractionException(f"Stream not available to user with the following errors given: {rejection_errors}")
 
         websocket_url = params["site"]["relive"]["webSocketUrl"]
-        event_loop = asyncio.get_event_loop()
-
-        if params["program"]["status"] == "ENDED":
-            if not websocket_url:
-                websocket_url = reserve_timeshift(session, nama_id)
-            event_loop.run_until_complete(
-                open_nama_websocket(session, websocket_url, event_loop, is_timeshift=True))
+        event_loop = asyncio.new_event_loop()
 
-        elif params["program"]["status"] == "ON_AIR":
-            event_loop.run_until_complete(
-                open_nama_websocket(session, websocket_url, event_loop, is_timeshift=False))
+        try:
+            if params["program"]["status"] == "ENDED":
+                if not websocket_url:
+                    websocket_url = reserve_timeshift(session, nama_id)
+                event_loop.run_until_complete(
+                    open_nama_websocket(session, websocket_url, event_loop, is_timeshift=True))
+
+            elif params["program"]["status"] == "ON_AIR":
+                event_loop.run_until_complete(
+                    open_nama_websocket(session, websocket_url, event_loop, is_timeshift=False))
+        finally:
+            event_loop.close()
 
     else:
         raise FormatNotAvailableException("Could not retrieve nama info")
@@ -622,29 +722,24 @@ def request_nama(session: requests.Session, nama_id: AnyStr):
 def decrypt_seiga_drm(enc_bytes, key):
     """Decrypt the light DRM applied to certain Seiga images."""
 
-    n = []
-    a = 8
-
-    for i in range(a):
-        start = 2 * i
-        value = int(key[start:start + 2], 16)
-        n.append(value)
+    key_bytes = bytes.fromhex(key[:16])
+    enc_len = len(enc_bytes)
 
-    dec_bytes = bytearray(enc_bytes)
-    for i in range(len(enc_bytes)):
-        dec_bytes[i] = dec_bytes[i] ^ n[i % a]
+    # XOR the whole payload against the repeated 8-byte key as two big integers rather than byte by byte
+    repeated_key = (key_bytes * (enc_len // len(key_bytes) + 1))[:enc_len]
+    dec_value = int.from_bytes(enc_bytes, "big") ^ int.from_bytes(repeated_key, "big")
+    return bytearray(dec_value.to_bytes(enc_len, "big"))
 
-    return dec_bytes
 
-
-def determine_seiga_file_type(dec_bytes):
+def determine_seiga_file_type(dec_bytes, is_complete=True):
     """Determine the image file type from a bytes array using magic numbers."""
 
-    if 255 == dec_bytes[0] and 216 == dec_bytes[1] and 255 == dec_bytes[len(dec_bytes) - 2] and 217 == dec_bytes[len(dec_bytes) - 1]:
+    # The JPEG end marker can only be checked once the whole image is available
+    if dec_bytes.startswith(b"\xff\xd8") and (not is_complete or dec_bytes.endswith(b"\xff\xd9")):
         return "jpg"
-    elif 137 == dec_bytes[0] and 80 == dec_bytes[1] and 78 == dec_bytes[2] and 71 == dec_bytes[3]:
+    elif dec_bytes.startswith(b"\x89PNG"):
         return "png"
-    elif 71 == dec_bytes[0] and 73 == dec_bytes[1] and 70 == dec_bytes[2] and 6 == dec_bytes[3]:
+    elif dec_bytes.startswith(b"GIF8"):
         return "gif"
     else:
         raise FormatNotSupportedException("Could not determine image file type")
@@ -701,7 +796,7 @@ def collect_seiga_manga_parameters(session, document, template_params):
     tags = []
     tags_request = session.get(SEIGA_MANGA_TAGS_API.format(bare_chapter_id))
     tags_request.raise_for_status()
-    tags_json = tags_request.json()
+    tags_json = orjson.loads(tags_request.content)
     if tags_json.get("tag_list"):
         for tag in tags_json["tag_list"]:
             tags.append(tag["name"])
@@ -730,28 +825,17 @@ def download_manga_chapter(session, chapter_id):
         output("Downloading {0} to \"{1}\"...\n".format(chapter_id, chapter_directory), logging.INFO)
 
         images = chapter_document.select("img.lazyload")
-        for index, image in enumerate(images):
-            image_url = image["data-original"]
-            image_request = session.get(image_url)
-            image_request.raise_for_status()
-            image_bytes = image_request.content
-
-            if "drm" in image_url:
-                key_match = SEIGA_DRM_KEY_RE.search(image_url)
-                if key_match:
-                    key = key_match.group(1)
-                else:
-                    raise FormatNotSupportedException("Could not succesffully extract DRM key")
-                image_bytes = decrypt_seiga_drm(image_bytes, key)
-
-            data_type = determine_seiga_file_type(image_bytes)
-
-            filename = str(index) + "." + data_type
-            image_path = os.path.join(chapter_directory, filename)
-
-            with open(image_path, "wb") as file:
-                output("\rPage {0}/{1}".format(index + 1, len(images)), logging.DEBUG)
-                file.write(image_bytes)
+        # Pages are independent files, so request them together; the shared session pools the connections
+        with ThreadPoolExecutor(max_workers=_CMDL_OPTS.threads or IMAGE_REQUEST_WORKERS) as executor:
+            page_futures = [executor.submit(download_manga_page, session, image["data-original"], chapter_directory, index) for index, image in enumerate(images)]
+            try:
+                for index, page_future in enumerate(as_completed(page_futures)):
+                    page_future.result()
+                    output("\rPage {0}/{1}".format(index + 1, len(images)), logging.DEBUG)
+            finally:
+                # Drop queued pages if one failed
+                for page_future in page_futures:
+                    page_future.cancel()
 
         output("\n", logging.DEBUG)
         output("Finished downloading {0} to \"{1}\".\n".format(chapter_id, chapter_directory), logging.INFO)
@@ -766,6 +850,40 @@ def download_manga_chapter(session, chapter_id):
         output("Downloading comments for Seiga comics is not currently supported.\n", logging.WARNING)
 
 
+def download_manga_page(session, image_url, chapter_directory, index):
+    """Download a single page image of a Seiga manga chapter."""
+
+    if "drm" in image_url:
+        key_match = SEIGA_DRM_KEY_RE.search(image_url)
+        if key_match:
+            key = key_match.group(1)
+        else:
+            raise FormatNotSupportedException("Could not succesffully extract DRM key")
+
+        # Decryption needs the whole image, so only DRM pages are held in memory
+        image_request = session.get(image_url)
+        image_request.raise_for_status()
+        image_bytes = decrypt_seiga_drm(image_request.content, key)
+
+        data_type = determine_seiga_file_type(image_bytes)
+        image_path = os.path.join(chapter_directory, str(index) + "." + data_type)
+        with open(image_path, "wb") as file:
+            file.write(image_bytes)
+
+    else:
+        with session.get(image_url, stream=True) as image_request:
+            image_request.raise_for_status()
+            image_blocks = image_request.iter_content(BLOCK_SIZE)
+            first_block = next(image_blocks, b"")
+
+            data_type = determine_seiga_file_type(first_block, is_complete=False)
+            image_path = os.path.join(chapter_directory, str(index) + "." + data_type)
+            with open(image_path, "wb") as file:
+                file.write(first_block)
+                for block in image_blocks:
+                    file.write(block)
+
+
 def download_manga(session, manga_id):
     """Download all chapters for a requested Seiga manga."""
 
@@ -776,10 +894,19 @@ def download_manga(session, manga_id):
 
     manga_document = BeautifulSoup(manga_request.text, "html.parser")
     chapters = manga_document.select("div.episode .title a")
-    for index, chapter in enumerate(chapters):
-        chapter_id = chapter["href"].lstrip("/watch/").split("?")[0]
-        output("{0}/{1}\n".format(index + 1, len(chapters)), logging.INFO)
-        download_manga_chapter(session, chapter_id)
+    chapter_ids = [chapter["href"].lstrip("/watch/").split("?")[0] for chapter in chapters]
+
+    # Overlap each chapter's page request and parse with the image downloads of the one before it
+    with ThreadPoolExecutor(max_workers=MANGA_CHAPTER_WORKERS) as executor:
+        chapter_futures = [executor.submit(download_manga_chapter, session, chapter_id) for chapter_id in chapter_ids]
+        try:
+            for index, chapter_future in enumerate(chapter_futures):
+                chapter_future.result()
+                output("{0}/{1}\n".format(index + 1, len(chapter_ids)), logging.INFO)
+        finally:
+            # Drop queued chapters if one failed
+            for chapter_future in chapter_futures:
+                chapter_future.cancel()
 
 
 def download_image(session, image_id):
@@ -819,25 +946,8 @@ def request_seiga_user(session, user_id):
 
     output("Downloading images from Seiga user {0}...\n".format(user_id), logging.INFO)
 
-    page_counter = 1
-    illust_ids = []
-
-    # Dumb loop, process pages until we reach a page with no images
-    while True:
-        user_illust_request = session.get(SEIGA_USER_ILLUST_URL.format(user_id, page_counter))
-        user_illust_request.raise_for_status()
-
-        user_illust_document = BeautifulSoup(user_illust_request.text, "html.parser")
-        illust_links = user_illust_document.select(".illust_list .list_item a")
-
-        if len(illust_links) == 0:
-            break
-
-        for link in illust_links:
-            unstripped_id = link["href"]
-            illust_ids.append(re.sub(r"^/seiga/", "", unstripped_id))
-
-        page_counter += 1
+    illust_links = request_listing_links(session, SEIGA_USER_ILLUST_URL, user_id, ".illust_list .list_item a")
+    illust_ids = [SEIGA_IMAGE_PATH_RE.sub("", unstripped_id) for unstripped_id in illust_links]
 
     total_ids = len(illust_ids)
     if total_ids == 0:
@@ -866,26 +976,8 @@ def request_seiga_user_manga(session, user_id):
 
     output("Downloading manga from Seiga user {0}...\n".format(user_id), logging.INFO)
 
-    page_counter = 1
-    manga_ids = []
-
-    # Dumb loop, process pages until we reach a page with no images
-    while True:
-        user_manga_request = session.get(SEIGA_USER_MANGA_URL.format(user_id, page_counter))
-        user_manga_request.raise_for_status()
-
-        user_manga_document = BeautifulSoup(user_manga_request.text, "html.parser")
-        manga_links = user_manga_document.select("#comic_list .mg_item .title a")
-
-        if len(manga_links) == 0:
-            break
-
-        for link in manga_links:
-            unstripped_id = link["href"]
-            manga_id = SEIGA_MANGA_ID_RE.match(unstripped_id).group(1)
-            manga_ids.append(manga_id)
-
-        page_counter += 1
+    manga_links = request_listing_links(session, SEIGA_USER_MANGA_URL, user_id, "#comic_list .mg_item .title a")
+    manga_ids = [SEIGA_MANGA_ID_RE.match(unstripped_id).group(1) for unstripped_id in manga_links]
 
     total_ids = len(manga_ids)
     if total_ids == 0:
@@ -925,22 +1017,20 @@ def download_channel_article(session: requests.Session, article_id: AnyStr):
         "uploader": article_document.select_one(".profileArea span.name").text
     }
 
-    if article_document.select_one(".profileArea span.name a"):
-        template_params["uploader_id"] = int(article_document.select_one(".profileArea span.name a")["href"].rsplit("/")[-1])
+    uploader_link = article_document.select_one(".profileArea span.name a")
+    if uploader_link:
+        template_params["uploader_id"] = int(uploader_link["href"].rsplit("/")[-1])
 
     template_params["comment_count"] = 0
-    if article_document.select_one("header.content .comment_count"):
-        template_params["comment_count"] = int(article_document.select_one("header.content .comment_count").text)
+    comment_count = article_document.select_one("header.content .comment_count")
+    if comment_count:
+        template_params["comment_count"] = int(comment_count.text)
 
-    template_params["title"] = article_text = article_document.select_one("#article_blog_title").text
+    template_params["title"] = article_document.select_one("#article_blog_title").text
     template_params["published"] = article_document.select_one(".article_blog_data_first span").text
     template_params["article"] = article_text = article_document.select_one(".main_blog_txt").decode_contents()
     template_params["document_url"] = article_request.url
-
-    tags = []
-    for tag in article_document.select(".tag_list li"):
-        tags.append(tag.text)
-    template_params["tags"] = tags
+    template_params["tags"] = [tag.text for tag in article_document.select(".tag_list li")]
 
     filename = create_filename(template_params)
 
@@ -948,10 +1038,7 @@ def download_channel_article(session: requests.Session, article_id: AnyStr):
         output("Downloading {0} to \"{1}\"...\n".format(article_id, filename), logging.INFO)
 
         with open(filename, "w", encoding="utf-8") as article_file:
-            pretty_article_text = article_text.replace("<br/>", "\n").replace("<br>", "\n").replace("</br>", "").replace("<p>", "\n").replace(
-                "</p>", "\n").replace("<hr/>", "---\n").replace("<strong>", "**").replace("</strong>", "**").replace( "<h2>", "\n## ").replace(
-                "</h2>", "\n").replace("<h3>", "\n### ").replace("</h3>", "\n").replace("<ul>", "").replace( "</ul>", "").replace(
-                "<li>", "- ").replace("</li>", "\n").strip()
+            pretty_article_text = ARTICLE_MARKDOWN_RE.sub(lambda tag: ARTICLE_MARKDOWN_REPLACEMENTS[tag.group(0)], article_text).strip()
             article_file.write(pretty_article_text)
     if _CMDL_OPTS.dump_metadata:
         dump_metadata(filename, template_params)
@@ -965,24 +1052,8 @@ def request_channel(session: requests.Session, channel_slug: AnyStr):
     """Request videos associated with a channel."""
 
     output("Requesting videos from channel {0}...\n".format(channel_slug), logging.INFO)
-    page_counter = 1
-    video_ids = []
-
-    # Dumb loop, process pages until we reach a page with no videos
-    while True:
-        channel_videos_request = session.get(CHANNEL_VIDEOS_URL.format(channel_slug, page_counter))
-        channel_videos_request.raise_for_status()
-        channel_videos_document = BeautifulSoup(channel_videos_request.text, "html.parser")
-        video_links = channel_videos_document.select("h6.title a")
-
-        if len(video_links) == 0:
-            break
-
-        for link in video_links:
-            unstripped_id = link["href"]
-            video_ids.append(re.sub(r"^https://www.nicovideo.jp/watch/", "", unstripped_id))
-
-        page_counter += 1
+    video_links = request_listing_links(session, CHANNEL_VIDEOS_URL, channel_slug, "h6.title a")
+    video_ids = [CHANNEL_VIDEO_URL_RE.sub("", unstripped_id) for unstripped_id in video_links]
 
     total_ids = len(video_ids)
     if total_ids == 0:
@@ -1014,15 +1085,45 @@ def request_channel_blog(session: requests.Session, channel_slug: AnyStr):
     blog_request.raise_for_status()
     blog_document = BeautifulSoup(blog_request.text, "html.parser")
     total_pages = int(blog_document.select_one("span.page_all").text)
+    article_selector = "h3:first-child a"
+    article_links = [article["href"] for article in blog_document.select(article_selector)]
+
+    # The first page gives the total, so the remaining pages can be requested together
+    with ThreadPoolExecutor(max_workers=PAGE_REQUEST_WORKERS) as executor:
+        page_urls = [CHANNEL_BLOMAGA_URL.format(channel_slug, page) for page in range(2, total_pages + 1)]
+        for page_links in executor.map(functools.partial(request_page_links, session, selector=article_selector), page_urls):
+            article_links.extend(page_links)
+
+    for index, article_link in enumerate(article_links):
+        output("{0}/{1}\n".format(index + 1, len(article_links)), logging.INFO)
+        download_channel_article(session, article_link.rsplit("/")[-1])
+
+
+def request_page_links(session: requests.Session, url: AnyStr, selector: AnyStr) -> List:
+    """Request a page and return the targets of the links matching a selector."""
+
+    page_request = session.get(url)
+    page_request.raise_for_status()
+    page_document = BeautifulSoup(page_request.text, "html.parser")
+    return [link["href"] for link in page_document.select(selector)]
 
-    for page in range(1, total_pages + 1):
-        output("Page {0}/{1}\n".format(page, total_pages), logging.INFO)
-        blog_request = session.get(CHANNEL_BLOMAGA_URL.format(channel_slug, page))
-        blog_request.raise_for_status()
-        blog_document = BeautifulSoup(blog_request.text, "html.parser")
-        articles = blog_document.select("h3:first-child a")
-        for article in articles:
-            download_channel_article(session, article["href"].rsplit("/")[-1])
+
+def request_listing_links(session: requests.Session, listing_url: AnyStr, listing_id: AnyStr, selector: AnyStr) -> List:
+    """Request pages of a listing until one has no matching links and return the collected link targets."""
+
+    links = []
+    first_page = 1
+    request_links = functools.partial(request_page_links, session, selector=selector)
+
+    # Listings don't report a total, so request pages a batch at a time until one comes back empty
+    with ThreadPoolExecutor(max_workers=PAGE_REQUEST_WORKERS) as executor:
+        while True:
+            page_urls = [listing_url.format(listing_id, page) for page in range(first_page, first_page + PAGE_REQUEST_WORKERS)]
+            for page_links in executor.map(request_links, page_urls):
+                if not page_links:
+                    return links
+                links.extend(page_links)
+            first_page += PAGE_REQUEST_WORKERS
 
 
 def request_channel_lives(session: requests.Session, channel_id: AnyStr):
@@ -1040,10 +1141,10 @@ def request_video(session: requests.Session, video_id: AnyStr):
     # Preserved as a sanity check, previously used to check video type
     thumb_info_request = session.get(THUMB_INFO_API.format(video_id))
     thumb_info_request.raise_for_status()
-    video_info = xml.dom.minidom.parseString(thumb_info_request.text)
+    video_info = xml.etree.ElementTree.fromstring(thumb_info_request.content)
 
-    if video_info.firstChild.getAttribute("status") != "ok":
-        video_error_code = video_info.getElementsByTagName("error")[0].getElementsByTagName("code")[0].firstChild.nodeValue
+    if video_info.get("status") != "ok":
+        video_error_code = video_info.findtext("error/code")
         if video_error_code == "DELETED":
             raise FormatNotAvailableException("Video was deleted")
         elif video_error_code == "NOT_FOUND":
@@ -1062,18 +1163,23 @@ def request_video(session: requests.Session, video_id: AnyStr):
 
     video_request = session.get(VIDEO_URL.format(video_id), cookies=concat_cookies)
     video_request.raise_for_status()
-    document = BeautifulSoup(video_request.text, "html.parser")
 
-    template_params = perform_api_request(session, document)
+    # DMC sessions are kept alive by a heartbeat thread until the media download ends
+    stop_heartbeat = threading.Event()
+    try:
+        template_params = perform_api_request(session, video_request.text, stop_heartbeat)
 
-    filename = create_filename(template_params)
+        filename = create_filename(template_params)
+
+        if not _CMDL_OPTS.skip_media:
+            continue_code = download_video_media(session, filename, template_params)
+            if _CMDL_OPTS.break_on_existing and not continue_code:
+                raise ExistingDownloadEncounteredQuit("Exiting as an existing video was encountered")
+            if _CMDL_OPTS.add_metadata:
+                add_metadata_to_container(filename, template_params)
+    finally:
+        stop_heartbeat.set()
 
-    if not _CMDL_OPTS.skip_media:
-        continue_code = download_video_media(session, filename, template_params)
-        if _CMDL_OPTS.break_on_existing and not continue_code:
-            raise ExistingDownloadEncounteredQuit("Exiting as an existing video was encountered")
-        if _CMDL_OPTS.add_metadata:
-            add_metadata_to_container(filename, template_params)
     if _CMDL_OPTS.dump_metadata:
         dump_metadata(filename, template_params)
     if _CMDL_OPTS.download_thumbnail:
@@ -1093,10 +1199,10 @@ def request_user(session: requests.Session, user_id: AnyStr):
 
     video_ids = []
 
-    session.options(USER_VIDEOS_API.format(user_id, USER_VIDEOS_API_N, 1), headers=API_HEADERS) # OPTIONS
+    send_preflight(session, USER_VIDEOS_API, USER_VIDEOS_API.format(user_id, USER_VIDEOS_API_N, 1), headers=API_HEADERS)
     videos_request = session.get(USER_VIDEOS_API.format(user_id, USER_VIDEOS_API_N, 1), headers=API_HEADERS)
     videos_request.raise_for_status()
-    user_videos_json = json.loads(videos_request.text)
+    user_videos_json = orjson.loads(videos_request.content)
     user_videos_count = int(user_videos_json["data"]["totalCount"])
 
     if user_videos_count == 0:
@@ -1105,12 +1211,15 @@ def request_user(session: requests.Session, user_id: AnyStr):
     output("{} videos returned.\n".format(user_videos_count), logging.INFO)
     total_pages = math.ceil(user_videos_count / USER_VIDEOS_API_N)
 
-    for page in range(1, total_pages + 1):
-        videos_request = session.get(USER_VIDEOS_API.format(user_id, USER_VIDEOS_API_N, page), headers=API_HEADERS)
-        videos_request.raise_for_status()
-        user_videos_json = json.loads(videos_request.text)
-        for video in user_videos_json["data"]["items"]:
-            video_ids.append(video["essential"]["id"])
+    for video in user_videos_json["data"]["items"]:
+        video_ids.append(video["essential"]["id"])
+
+    # The first page gives the total, so the remaining pages can be requested together
+    with ThreadPoolExecutor(max_workers=PAGE_REQUEST_WORKERS) as executor:
+        page_futures = [executor.submit(request_user_videos_page, session, user_id, page) for page in range(2, total_pages + 1)]
+        for page_future in page_futures:
+            for video in page_future.result():
+                video_ids.append(video["essential"]["id"])
 
     if _CMDL_OPTS.playlist_start:
         start_index = _CMDL_OPTS.playlist_start
@@ -1130,15 +1239,23 @@ def request_user(session: requests.Session, user_id: AnyStr):
             continue
 
 
+def request_user_videos_page(session: requests.Session, user_id: AnyStr, page: int) -> List:
+    """Request a single page of videos associated with a user."""
+
+    videos_request = session.get(USER_VIDEOS_API.format(user_id, USER_VIDEOS_API_N, page), headers=API_HEADERS)
+    videos_request.raise_for_status()
+    return orjson.loads(videos_request.content)["data"]["items"]
+
+
 def request_mylist(session: requests.Session, mylist_id: AnyStr, is_authed_user: bool = False):
     """Request videos associated with a mylist."""
 
     output("Requesting mylist {0}...\n".format(mylist_id), logging.INFO)
     active_mylist_api = MYLIST_ME_API if is_authed_user else MYLIST_API
-    session.options(active_mylist_api.format(mylist_id), headers=API_HEADERS) # OPTIONS
+    send_preflight(session, active_mylist_api, active_mylist_api.format(mylist_id), headers=API_HEADERS)
     mylist_request = session.get(active_mylist_api.format(mylist_id), headers=API_HEADERS)
     mylist_request.raise_for_status()
-    mylist_json = json.loads(mylist_request.text)
+    mylist_json = orjson.loads(mylist_request.content)
     items = mylist_json["data"]["mylist"]["items"]
 
     if _CMDL_OPTS.playlist_start:
@@ -1149,6 +1266,14 @@ def request_mylist(session: requests.Session, mylist_id: AnyStr, is_authed_user:
             items = items[start_index:]
             output("Beginning at index {}.\n".format(start_index), logging.INFO)
 
+    concurrency = _CMDL_OPTS.mylist_concurrency
+    if concurrency and concurrency > 1:
+        if _CMDL_OPTS.threads:
+            output("--mylist-concurrency cannot be combined with --threads. Downloading mylist videos one at a time.\n", logging.WARNING)
+        else:
+            request_mylist_concurrently(session, items, concurrency)
+            return
+
     for index, item in enumerate(items):
         try:
             output("{0}/{1}\n".format(index + 1, len(items)), logging.INFO)
@@ -1159,6 +1284,26 @@ def request_mylist(session: requests.Session, mylist_id: AnyStr, is_authed_user:
             continue
 
 
+def request_mylist_concurrently(session: requests.Session, items: List, concurrency: int):
+    """Request videos associated with a mylist using a pool of workers."""
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        video_futures = [executor.submit(request_video, session, item["watchId"]) for item in items]
+        try:
+            for index, video_future in enumerate(video_futures):
+                try:
+                    video_future.result()
+                    output("{0}/{1}\n".format(index + 1, len(items)), logging.INFO)
+
+                except (FormatNotSupportedException, FormatNotAvailableException, ParameterExtractionException) as error:
+                    log_exception(error)
+                    continue
+        finally:
+            # Drop queued videos if a download stopped the list early
+            for video_future in video_futures:
+                video_future.cancel()
+
+
 def request_user_mylists(session: requests.Session, user_id: AnyStr):
     """Request mylists associated with a user."""
 
@@ -1170,7 +1315,7 @@ def request_user_mylists(session: requests.Session, user_id: AnyStr):
 
     mylists_request = session.get(USER_MYLISTS_API.format(user_id), headers=API_HEADERS)
     mylists_request.raise_for_status()
-    user_mylists_json = json.loads(mylists_request.text)
+    user_mylists_json = orjson.loads(mylists_request.content)
     user_mylists = user_mylists_json["data"]["mylists"]
     total_mylists = len(user_mylists)
     output("{} mylists returned.\n".format(total_mylists), logging.INFO)
@@ -1188,10 +1333,10 @@ def request_series(session: requests.Session, series_id: AnyStr):
     "Request videos associated with a series."
 
     output("Requesting series {0}...\n".format(series_id), logging.INFO)
-    session.options(SERIES_API.format(series_id), headers=API_HEADERS) # OPTIONS
+    send_preflight(session, SERIES_API, SERIES_API.format(series_id), headers=API_HEADERS)
     series_request = session.get(SERIES_API.format(series_id), headers=API_HEADERS)
     series_request.raise_for_status()
-    mylist_json = json.loads(series_request.text)
+    mylist_json = orjson.loads(series_request.content)
     items = mylist_json["data"]["items"]
 
     if _CMDL_OPTS.playlist_start:
@@ -1219,7 +1364,7 @@ def request_user_series(session: requests.Session, user_id: AnyStr):
 
     series_request = session.get(USER_SERIES_API.format(user_id), headers=API_HEADERS)
     series_request.raise_for_status()
-    user_series_json = json.loads(series_request.text)
+    user_series_json = orjson.loads(series_request.content)
     user_series = user_series_json["data"]["items"]
     for index, item in enumerate(user_series):
         try:
@@ -1242,7 +1387,7 @@ def request_user_following(session: requests.Session, user_id: AnyStr):
 
     following_request = session.get(USER_FOLLOWING_API.format(user_id), headers=API_HEADERS)
     following_request.raise_for_status()
-    following_json = json.loads(following_request.text)
+    following_json = orjson.loads(following_request.content)
     following = following_json["data"]["items"]
 
     for item in following:
@@ -1250,47 +1395,43 @@ def request_user_following(session: requests.Session, user_id: AnyStr):
         output(f"{user_url}\n", logging.INFO, force=True)
 
 
-def show_multithread_progress(video_len):
+def show_multithread_progress(video_len, part_futures: List):
     """Track overall download progress across threads."""
 
     global _PROGRESS, _START_TIME
     finished = False
     while not finished:
-        if _PROGRESS >= video_len:
+        # Refresh a few times a second, returning as soon as any part fails so the caller can stop the rest
+        done_parts, pending_parts = wait(part_futures, timeout=PROGRESS_INTERVAL_S, return_when=FIRST_EXCEPTION)
+        failed = any(part_future.exception() for part_future in done_parts)
+        if _PROGRESS >= video_len or not pending_parts or failed:
             finished = True
-        done = int(25 * _PROGRESS / video_len)
-        percent = int(100 * _PROGRESS / video_len)
-        speed_str = calculate_speed(_START_TIME, time.time(), _PROGRESS)
-        output("\r|{0}{1}| {2}/100 @ {3:9}/s".format("#" * done, " " * (25 - done), percent, speed_str), logging.DEBUG)
+        output_progress(_PROGRESS, video_len, _START_TIME)
 
 
 def update_multithread_progress(bytes_len):
     """Acquire lock on global download progress and update."""
 
-    lock = threading.Lock()
-    lock.acquire()
-    try:
-        global _PROGRESS
+    global _PROGRESS
+    with _PROGRESS_LOCK:
         _PROGRESS += bytes_len
-    finally:
-        lock.release()
 
 
-def download_video_part(session: requests.Session, start, end, filename: AnyStr, url: AnyStr):
+def download_video_part(session: requests.Session, start, end, filename: AnyStr, url: AnyStr, stop_parts: threading.Event):
     """Download a video part using specified start and end byte boundaries."""
 
     resume_header = {"Range": "bytes={0}-{1}".format(start, end - 1)}
 
-    dl_stream = session.get(url, headers=resume_header, stream=True)
-    dl_stream.raise_for_status()
-    stream_iterator = dl_stream.iter_content(BLOCK_SIZE)
-
     # part_length = end - start
     current_pos = start
 
-    with open(filename, "r+b") as file:
+    with session.get(url, headers=resume_header, stream=True) as dl_stream, open(filename, "r+b") as file:
+        dl_stream.raise_for_status()
         file.seek(current_pos)
-        for block in stream_iterator:
+        for block in dl_stream.iter_content(BLOCK_SIZE):
+            # Give up between blocks once another part failed or the download was interrupted
+            if stop_parts.is_set():
+                return
             current_pos += len(block)
             file.write(block)
             update_multithread_progress(len(block))
@@ -1299,50 +1440,54 @@ def download_video_part(session: requests.Session, start, end, filename: AnyStr,
 def perform_native_hls_dl(session: requests.Session, filename: AnyStr, duration: float, m3u8_streams: List, threads: int = 1):
     """Download video and audio streams using native HLS downloader and merge using ffmpeg if necessary."""
 
-    with get_temp_dir() as temp_dir:
-        with Progress() as progress:
-            tasks = []
-            for stream, name in m3u8_streams:
-                random_path_string = ''.join(random.choices(string.ascii_letters + string.digits, k=TEMP_PATH_LEN))
-                stream_filename = replace_extension(os.path.join(temp_dir, random_path_string), "ts")
-                thread = threading.Thread(target=download_hls, args=(stream, stream_filename, name, session, progress, threads))
-                thread.start()
-                tasks.append({
-                    "thread": thread,
-                    "filename": stream_filename,
-                })
-
-            for task in tasks:
-                task["thread"].join()
-
-        if not tasks:
-            raise ArgumentException("No HLS download tasks were received")
-
-        # Video and audio
-        if len(tasks) > 1:
-            stream_filenames = [task["filename"] for task in tasks]
-
+    if not m3u8_streams:
+        raise ArgumentException("No HLS download tasks were received")
+
+    with Progress() as progress, ThreadPoolExecutor(max_workers=len(m3u8_streams)) as executor:
+        tasks = []
+        for stream, name, stream_id in m3u8_streams:
+            # Keep stream files beside the output so an interrupted download can be resumed
+            stream_filename = replace_extension(filename, f"{name}.ts")
+            tasks.append({
+                "future": executor.submit(download_hls, stream, stream_filename, name, session, progress, threads, stream_id),
+                "filename": stream_filename,
+                "name": name,
+            })
+
+        # Stop before merging or moving anything, leaving incomplete stream files and their resume state for the next run
+        for task in tasks:
             try:
-                video_convert = FfmpegDL(streams=stream_filenames,
-                                        input_kwargs={},
-                                        output_path=filename,
-                                        output_kwargs={
-                                            "vcodec": "copy",
-                                            "acodec": "copy",
-                                        })
-                video_convert.convert(name='Merging audio and video', duration=duration)
-            except FfmpegExistsException as error:
-                raise(error)
-            except FfmpegDLException as error:
-                raise FormatNotAvailableException(f"ffmpeg failed to download the video or audio stream with the following error: \"{error}\"") from error
+                task["future"].result()
+            except FormatNotAvailableException:
+                raise
             except Exception as exception:
-                raise FormatNotAvailableException("Failed to download video or audio stream") from exception
+                raise FormatNotAvailableException("Failed to download {0} stream".format(task["name"])) from exception
 
-            for stream_filename in stream_filenames:
-                os.remove(stream_filename)
-        # Only audio or video
-        else:
-            shutil.move(tasks[0]["filename"], filename)
+    # Video and audio
+    if len(tasks) > 1:
+        stream_filenames = [task["filename"] for task in tasks]
+
+        try:
+            video_convert = FfmpegDL(streams=stream_filenames,
+                                    input_kwargs={},
+                                    output_path=filename,
+                                    output_kwargs={
+                                        "vcodec": "copy",
+                                        "acodec": "copy",
+                                    })
+            video_convert.convert(name='Merging audio and video', duration=duration)
+        except FfmpegExistsException as error:
+            raise(error)
+        except FfmpegDLException as error:
+            raise FormatNotAvailableException(f"ffmpeg failed to download the video or audio stream with the following error: \"{error}\"") from error
+        except Exception as exception:
+            raise FormatNotAvailableException("Failed to download video or audio stream") from exception
+
+        for stream_filename in stream_filenames:
+            os.remove(stream_filename)
+    # Only audio or video
+    else:
+        shutil.move(tasks[0]["filename"], filename)
     return True
 
 
@@ -1361,14 +1506,13 @@ def download_video_media(session: requests.Session, filename: AnyStr, template_p
 
     # Dwango Media Service (DMS)
     if template_params.get("dms_video_uri") or template_params.get("dms_audio_uri"):
-        # .part file
-        if os.path.exists(filename):
-            output("Resuming partial downloads is not supported for videos using DMS delivery. Any partial video data will be overwritten.\n", logging.WARNING)
-
         m3u8_streams = []
-        for stream_type, name in [("dms_video_uri", "video"), ("dms_audio_uri", "audio")]:
+        for stream_type, name, quality_type in [("dms_video_uri", "video", "video_quality"), ("dms_audio_uri", "audio", "audio_quality")]:
             if template_params.get(stream_type):
-                m3u8_streams.append((template_params[stream_type], name))
+                # The quality is either the selected ID or the available IDs, the first of which was requested
+                quality = template_params[quality_type]
+                stream_id = quality if isinstance(quality, str) else quality[0]
+                m3u8_streams.append((template_params[stream_type], name, stream_id))
         continue_code = perform_native_hls_dl(session, filename, float(template_params["duration"]), m3u8_streams, _CMDL_OPTS.threads)
         os.rename(filename, complete_filename)
         return continue_code
@@ -1390,9 +1534,7 @@ def download_video_media(session: requests.Session, filename: AnyStr, template_p
         _PROGRESS = 0
 
         # Pad out file to full length
-        file = open(filename, "wb")
-        file.truncate(video_len)
-        file.close()
+        preallocate_file(filename, video_len)
 
         # Calculate ranges for threads and dispatch
         part = math.ceil(video_len / threads)
@@ -1400,57 +1542,62 @@ def download_video_media(session: requests.Session, filename: AnyStr, template_p
         global _START_TIME
         _START_TIME = time.time()
 
-        for i in range(threads):
-            start = part * i
-            end = video_len if i == threads - 1 else start + part
+        stop_parts = threading.Event()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            part_futures = []
+            for i in range(threads):
+                start = part * i
+                end = video_len if i == threads - 1 else start + part
+                part_futures.append(executor.submit(download_video_part, session, start, end, filename, template_params["url"], stop_parts))
 
-            part_thread = threading.Thread(
-                target=download_video_part,
-                kwargs={"start": start, "end": end, "filename": filename, "session": session, "url": template_params["url"]},
-                daemon=True
-            )
-            part_thread.start()
+            try:
+                show_multithread_progress(video_len, part_futures)
+                output("\n", logging.DEBUG)
 
-        progress_thread = threading.Thread(target=show_multithread_progress, kwargs={"video_len": video_len})
-        progress_thread.start()
-        progress_thread.join()  # Wait for progress thread to terminate
-        output("\n", logging.DEBUG)
+                for part_future in part_futures:
+                    part_future.result()  # Raise the first error encountered by a part
+            finally:
+                # Stop the remaining parts on an error or Ctrl+C so leaving the pool doesn't wait for every range to finish
+                stop_parts.set()
 
         output("Finished downloading {0} to \"{1}\".\n".format(template_params["id"], filename), logging.INFO)
         os.rename(filename, complete_filename)
         return True
 
     # .part file
-    if os.path.isfile(filename):
-        with open(filename, "rb"):
-            current_byte_pos = os.path.getsize(filename)
-            if current_byte_pos < video_len:
-                file_condition = "ab"
-                resume_header = {"Range": "bytes={0}-".format(current_byte_pos - BLOCK_SIZE)}
-                dl = current_byte_pos - BLOCK_SIZE
-                output("Checking file integrity before resuming.\n")
-
-            elif current_byte_pos > video_len:
-                try:
-                    if MP4(filename).tags:  # Container metadata is only written after a complete download
-                        output("Existing file container has metadata written and should be complete.\n", logging.INFO)
-                        return False
-                    else:
-                        raise FormatNotAvailableException(
-                            "Current byte position exceeds the length of the video to be downloaded. Check the integrity of the existing file and "
-                            "use --force-high-quality to resume this download when the high quality source is available.\n"
-                        )
-                except MP4StreamInfoError as error:  # Thrown if not a valid MP4 (FLV, SWF)
+    try:
+        current_byte_pos = os.path.getsize(filename)
+    except FileNotFoundError:
+        current_byte_pos = None
+
+    if current_byte_pos is not None:
+        if current_byte_pos < video_len:
+            file_condition = "ab"
+            resume_header = {"Range": "bytes={0}-".format(max(current_byte_pos - BLOCK_SIZE, 0))}
+            dl = current_byte_pos - BLOCK_SIZE
+            output("Checking file integrity before resuming.\n")
+
+        elif current_byte_pos > video_len:
+            try:
+                if MP4(filename).tags:  # Container metadata is only written after a complete download
+                    output("Existing file container has metadata written and should be complete.\n", logging.INFO)
+                    return False
+                else:
                     raise FormatNotAvailableException(
-                        "Current byte position exceeds the length of the video to be downloaded. Check the integrity of the existing file and use "
-                        "--force-high-quality to resume this download when the high quality source is available.\n"
-                    ) from error
+                        "Current byte position exceeds the length of the video to be downloaded. Check the integrity of the existing file and "
+                        "use --force-high-quality to resume this download when the high quality source is available.\n"
+                    )
+            except MP4StreamInfoError as error:  # Thrown if not a valid MP4 (FLV, SWF)
+                raise FormatNotAvailableException(
+                    "Current byte position exceeds the length of the video to be downloaded. Check the integrity of the existing file and use "
+                    "--force-high-quality to resume this download when the high quality source is available.\n"
+                ) from error
 
-            # current_byte_pos == video_len
-            else:
-                output("File exists and matches current download length.\n", logging.INFO)
-                os.rename(filename, complete_filename)
-                return True # Video was actually complete, but extension wasn't updated
+        # current_byte_pos == video_len
+        else:
+            output("File exists and matches current download length.\n", logging.INFO)
+            os.rename(filename, complete_filename)
+            return True # Video was actually complete, but extension wasn't updated
 
     else:
         file_condition = "wb"
@@ -1461,41 +1608,40 @@ def download_video_media(session: requests.Session, filename: AnyStr, template_p
     dl_stream.raise_for_status()
     stream_iterator = dl_stream.iter_content(BLOCK_SIZE)
 
-    if os.path.isfile(filename):
+    if file_condition == "ab":
         new_data = next(stream_iterator)
         new_data_len = len(new_data)
 
-        existing_byte_pos = os.path.getsize(filename)
-        if existing_byte_pos - new_data_len <= 0:
+        if current_byte_pos - new_data_len <= 0:
             output("Byte comparison block exceeds the length of the existing file. Deleting existing file and redownloading...\n", logging.WARNING)
             os.remove(filename)
-            download_video_media(session, filename, template_params)
+            download_video_media(session, complete_filename, template_params)
             return True
 
-        file = open(filename, "rb")
-        file.seek(current_byte_pos - BLOCK_SIZE)
-        existing_data = file.read()[:new_data_len]
+        with open(filename, "rb") as file:
+            file.seek(current_byte_pos - BLOCK_SIZE)
+            existing_data = file.read(new_data_len)
         if new_data == existing_data:
             dl += new_data_len
             output("Resuming at byte position {0}.\n".format(dl))
-            file.close()
         else:
             output("Byte comparison block does not match. Deleting existing file and redownloading...\n", logging.WARNING)
-            file.close()
             os.remove(filename)
-            download_video_media(session, filename, template_params)
+            download_video_media(session, complete_filename, template_params)
             return True
 
     with open(filename, file_condition) as file:
         file.seek(dl)
-        _START_TIME = time.time()
+        start_time = last_output_time = time.time()
         for block in stream_iterator:
             dl += len(block)
             file.write(block)
-            done = int(25 * dl / video_len)
-            percent = int(100 * dl / video_len)
-            speed_str = calculate_speed(_START_TIME, time.time(), dl)
-            output("\r|{0}{1}| {2}/100 @ {3:9}/s".format("#" * done, " " * (25 - done), percent, speed_str), logging.DEBUG)
+            # Limit progress formatting and console writes to a few times a second
+            now = time.time()
+            if now - last_output_time >= PROGRESS_INTERVAL_S:
+                output_progress(dl, video_len, start_time)
+                last_output_time = now
+        output_progress(dl, video_len, start_time)
         output("\n", logging.DEBUG)
 
     output("Finished downloading {0} to \"{1}\".\n".format(template_params["id"], filename), logging.INFO)
@@ -1503,15 +1649,19 @@ def download_video_media(session: requests.Session, filename: AnyStr, template_p
     return True
 
 
-def perform_heartbeat(session: requests.Session, heartbeat_url: AnyStr, api_request_el: xml.dom.minidom.Node):
+def perform_heartbeat(session: requests.Session, heartbeat_url: AnyStr, api_request_el: xml.etree.ElementTree.Element) -> xml.etree.ElementTree.Element:
     """Perform a response heartbeat to keep the video download connection alive."""
-    heartbeat_response = session.post(heartbeat_url, data=api_request_el.toxml())
+
+    heartbeat_response = session.post(heartbeat_url, data=xml.etree.ElementTree.tostring(api_request_el))
     heartbeat_response.raise_for_status()
-    heartbeat_response_el = xml.dom.minidom.parseString(heartbeat_response.text).getElementsByTagName("session")[0]
-    heartbeat_timer = threading.Timer(DMC_HEARTBEAT_INTERVAL_S, perform_heartbeat, (session, heartbeat_url, heartbeat_response_el)
-    )
-    heartbeat_timer.daemon = True
-    heartbeat_timer.start()
+    return next(xml.etree.ElementTree.fromstring(heartbeat_response.content).iter("session"))
+
+
+def keep_heartbeat_alive(session: requests.Session, heartbeat_url: AnyStr, api_request_el: xml.etree.ElementTree.Element, stop_heartbeat: threading.Event):
+    """Perform response heartbeats at a regular interval until signalled to stop."""
+
+    while not stop_heartbeat.wait(DMC_HEARTBEAT_INTERVAL_S):
+        api_request_el = perform_heartbeat(session, heartbeat_url, api_request_el)
 
 
 def list_qualities(sources_type: str, sources: list, is_dms: bool):
@@ -1581,15 +1731,24 @@ def select_quality(template_params: dict, template_key: AnyStr, sources: list, q
         return bare_sources
 
 
-def perform_api_request(session: requests.Session, document: BeautifulSoup) -> dict:
+def perform_api_request(session: requests.Session, document_text: AnyStr, stop_heartbeat: threading.Event) -> dict:
     """Collect parameters from video document and build API request for video URL."""
 
     template_params = {}
 
+    # Pull the embedded parameters directly and only parse the full document if that fails
+    server_response_match = SERVER_RESPONSE_RE.search(document_text)
+    if server_response_match:
+        server_response = html.unescape(server_response_match.group(1))
+    else:
+        document = BeautifulSoup(document_text, "html.parser")
+        server_response_el = document.find("meta", {"name": "server-response"})
+        server_response = server_response_el["content"] if server_response_el else None
+
     # .mp4 videos (HTML5)
     # As of 2021, all videos are served this way
-    if document.find("meta", {"name": "server-response"}):
-        params = json.loads(document.find("meta", {"name": "server-response"})["content"])["data"]["response"]
+    if server_response:
+        params = orjson.loads(server_response)["data"]["response"]
 
         if params["video"]["isDeleted"]:
             raise FormatNotAvailableException("Video was deleted")
@@ -1602,56 +1761,64 @@ def perform_api_request(session: requests.Session, document: BeautifulSoup) -> d
         if _CMDL_OPTS.skip_media and not _CMDL_OPTS.list_qualities:
             return template_params
 
+        domand = params["media"]["domand"]
+        delivery = params["media"]["delivery"]
+
         # Perform request to Dwango Media Service (DMS)
         # Began rollout starting 2023-11-01 for select videos and users (https://blog.nicovideo.jp/niconews/205042.html)
         # Videos longer than 30 minutes in HD (>720p) quality appear to be served this way exclusively
-        elif params["media"]["domand"]:
+        if domand:
             if _CMDL_OPTS.list_qualities:
-                list_qualities("video", params["media"]["domand"]["videos"], True)
-                list_qualities("audio", params["media"]["domand"]["audios"], True)
+                list_qualities("video", domand["videos"], True)
+                list_qualities("audio", domand["audios"], True)
                 raise ListQualitiesQuit("Exiting after listing available qualities")
 
             video_id = params["video"]["id"]
-            access_right_key = params["media"]["domand"]["accessRightKey"]
+            access_right_key = domand["accessRightKey"]
             watch_track_id = params["client"]["watchTrackId"]
 
             video_sources = select_quality(
                 template_params,
                 "video_quality",
-                params["media"]["domand"]["videos"],
+                domand["videos"],
                 _CMDL_OPTS.video_quality
             )
             audio_sources = select_quality(
                 template_params,
                 "audio_quality",
-                params["media"]["domand"]["audios"],
+                domand["audios"],
                 _CMDL_OPTS.audio_quality
             )
 
             # Limited to one video and audio source
             video_source = video_sources[0]
             audio_source = audio_sources[0]
-            payload = json.dumps({"outputs":[[video_source, audio_source]]})
+            payload = orjson.dumps({"outputs":[[video_source, audio_source]]})
 
             output("Retrieving video manifest...\n", logging.INFO)
             headers = {
                 "X-Access-Right-Key": access_right_key,
                 "X-Request-With": "nicovideo", # Only provided on this endpoint
             }
-            session.options(VIDEO_DMS_WATCH_API.format(video_id, watch_track_id)) # OPTIONS
+            send_preflight(session, VIDEO_DMS_WATCH_API, VIDEO_DMS_WATCH_API.format(video_id, watch_track_id))
             get_manifest_request = session.post(VIDEO_DMS_WATCH_API.format(video_id, watch_track_id), headers={**API_HEADERS, **headers}, data=payload)
             get_manifest_request.raise_for_status()
-            manifest_url = get_manifest_request.json()["data"]["contentUrl"]
+            manifest_url = orjson.loads(get_manifest_request.content)["data"]["contentUrl"]
             manifest_request = session.get(manifest_url)
             manifest_request.raise_for_status()
             manifest_text = manifest_request.text
             output("Retrieved video manifest.\n", logging.INFO)
 
             output("Collecting video media URIs...\n")
+            best_stream, media_uris = parse_master_manifest(manifest_text)
             if not _CMDL_OPTS.no_video:
-                template_params["dms_video_uri"] = get_stream_from_manifest(manifest_text)
+                if not best_stream:
+                    raise FormatNotAvailableException("Could not retrieve stream playlist from manifest")
+                template_params["dms_video_uri"] = best_stream
             if not _CMDL_OPTS.no_audio:
-                template_params["dms_audio_uri"] = get_media_from_manifest(manifest_text, "audio")
+                if not media_uris.get("AUDIO"):
+                    raise FormatNotAvailableException("Could not retrieve media playlist from manifest")
+                template_params["dms_audio_uri"] = media_uris["AUDIO"]
 
             # Modify container when only one stream is specified
             if not template_params.get("dms_video_uri"):
@@ -1662,39 +1829,44 @@ def perform_api_request(session: requests.Session, document: BeautifulSoup) -> d
             output("Collected video media URIs.\n", logging.INFO)
 
         # Perform request to Dwango Media Cluster (DMC)
-        elif params["media"]["delivery"]:
+        elif delivery:
+            movie = delivery["movie"]
+            movie_session = movie["session"]
             if _CMDL_OPTS.list_qualities:
-                list_qualities("video", params["media"]["delivery"]["movie"]["videos"], False)
-                list_qualities("audio", params["media"]["delivery"]["movie"]["audios"], False)
+                list_qualities("video", movie["videos"], False)
+                list_qualities("audio", movie["audios"], False)
                 raise ListQualitiesQuit("Exiting after listing available qualities")
 
-            api_url = params["media"]["delivery"]["movie"]["session"]["urls"][0]["url"]
+            api_url = movie_session["urls"][0]["url"]
             api_url += "?suppress_response_codes=true&_format=xml"
-            recipe_id = params["media"]["delivery"]["movie"]["session"]["recipeId"]
-            content_id = params["media"]["delivery"]["movie"]["session"]["contentId"]
-            protocol = params["media"]["delivery"]["movie"]["session"]["protocols"][0]
+            recipe_id = movie_session["recipeId"]
+            content_id = movie_session["contentId"]
+            protocol = movie_session["protocols"][0]
             file_extension = template_params["ext"]
-            priority = params["media"]["delivery"]["movie"]["session"]["priority"]
+            priority = movie_session["priority"]
 
             video_sources = select_quality(
                 template_params,
                 "video_quality",
-                params["media"]["delivery"]["movie"]["videos"],
+                movie["videos"],
                 _CMDL_OPTS.video_quality
             )
             audio_sources = select_quality(
                 template_params,
                 "audio_quality",
-                params["media"]["delivery"]["movie"]["audios"],
+                movie["audios"],
                 _CMDL_OPTS.audio_quality
             )
 
-            heartbeat_lifetime = params["media"]["delivery"]["movie"]["session"]["heartbeatLifetime"]
-            token = params["media"]["delivery"]["movie"]["session"]["token"]
-            signature = params["media"]["delivery"]["movie"]["session"]["signature"]
-            auth_type = params["media"]["delivery"]["movie"]["session"]["authTypes"]["http"]
-            service_user_id = params["media"]["delivery"]["movie"]["session"]["serviceUserId"]
-            player_id = params["media"]["delivery"]["movie"]["session"]["playerId"]
+            heartbeat_lifetime = movie_session["heartbeatLifetime"]
+            token = movie_session["token"]
+            signature = movie_session["signature"]
+            auth_type = movie_session["authTypes"]["http"]
+            service_user_id = movie_session["serviceUserId"]
+            player_id = movie_session["playerId"]
+
+            video_src_ids = "".join("<string>{0}</string>".format(xml.sax.saxutils.escape(source)) for source in video_sources)
+            audio_src_ids = "".join("<string>{0}</string>".format(xml.sax.saxutils.escape(source)) for source in audio_sources)
 
             # Build initial heartbeat request
             post = """
@@ -1720,10 +1892,8 @@ def perform_api_request(session: requests.Session, document: BeautifulSoup) -> d
                         <content_src_id_set>
                           <content_src_ids>
                             <src_id_to_mux>
-                              <video_src_ids>
-                              </video_src_ids>
-                              <audio_src_ids>
-                              </audio_src_ids>
+                              <video_src_ids>{11}</video_src_ids>
+                              <audio_src_ids>{12}</audio_src_ids>
                             </src_id_to_mux>
                           </content_src_ids>
                         </content_src_id_set>
@@ -1761,37 +1931,25 @@ def perform_api_request(session: requests.Session, document: BeautifulSoup) -> d
                            signature,
                            auth_type,
                            service_user_id,
-                           player_id).strip()
-
-            root = xml.dom.minidom.parseString(post)
-            sources = root.getElementsByTagName("video_src_ids")[0]
-            for video_source in video_sources:
-                element = root.createElement("string")
-                quality = root.createTextNode(video_source)
-                element.appendChild(quality)
-                sources.appendChild(element)
-
-            sources = root.getElementsByTagName("audio_src_ids")[0]
-            for audio_source in audio_sources:
-                element = root.createElement("string")
-                quality = root.createTextNode(audio_source)
-                element.appendChild(quality)
-                sources.appendChild(element)
+                           player_id,
+                           video_src_ids,
+                           audio_src_ids).strip()
 
             output("Performing initial API request...\n", logging.INFO)
             headers = {"Content-Type": "application/xml"}
-            api_response = session.post(api_url, headers=headers, data=root.toxml())
+            api_response = session.post(api_url, headers=headers, data=post)
             api_response.raise_for_status()
-            api_request = xml.dom.minidom.parseString(api_response.text)
-            template_params["url"] = api_request.getElementsByTagName("content_uri")[0].firstChild.nodeValue
+            api_response_el = xml.etree.ElementTree.fromstring(api_response.content)
+            template_params["url"] = next(api_response_el.iter("content_uri")).text
             output("Performed initial API request.\n", logging.INFO)
 
             # Collect response for heartbeat
-            session_id = api_request.getElementsByTagName("id")[0].firstChild.nodeValue
-            session_url = params["media"]["delivery"]["movie"]["session"]["urls"][0]["url"]
+            session_id = next(api_response_el.iter("id")).text
+            session_url = movie_session["urls"][0]["url"]
             heartbeat_url = f"{session_url}/{session_id}?_format=xml&_method=PUT"
-            api_request_el = api_request.getElementsByTagName("session")[0]
-            perform_heartbeat(session, heartbeat_url, api_request_el)
+            api_request_el = perform_heartbeat(session, heartbeat_url, next(api_response_el.iter("session")))
+            heartbeat_thread = threading.Thread(target=keep_heartbeat_alive, args=(session, heartbeat_url, api_request_el, stop_heartbeat), daemon=True)
+            heartbeat_thread.start()
 
         else:
             if params["payment"]["video"]["isPremium"] or params["payment"]["video"]["isAdmission"] or params["payment"]["video"]["isPpv"]:
@@ -1847,32 +2005,31 @@ def collect_video_parameters(session: requests.Session, template_params: dict, p
 
     thumb_info_request = session.get(THUMB_INFO_API.format(template_params["id"]))
     thumb_info_request.raise_for_status()
-    thumb_info_document = xml.dom.minidom.parseString(thumb_info_request.text)
+    # Collect every element's text in one walk, keeping the first of any repeated tag
+    thumb_info = {}
+    for element in xml.etree.ElementTree.fromstring(thumb_info_request.content).iter():
+        thumb_info.setdefault(element.tag, element.text)
 
     # DMC and DMS videos do not expose the file type in the video page parameters when not logged in
     # As of 2021, all videos are served on the HTML5 player as .mp4
     # This is maintained as a sanity check
     if not template_params.get("ext"):
-        template_params["ext"] = thumb_info_document.getElementsByTagName("movie_type")[0].firstChild.nodeValue
+        template_params["ext"] = thumb_info["movie_type"]
         if template_params["ext"] == "swf" or template_params["ext"] == "flv":
             template_params["ext"] = "mp4"
 
     # No longer really relevant for new videos, but the API continues to report for pre-DMC viodeos
-    template_params["size_high"] = int(thumb_info_document.getElementsByTagName("size_high")[0].firstChild.nodeValue)
-    template_params["size_low"] = int(thumb_info_document.getElementsByTagName("size_low")[0].firstChild.nodeValue)
+    template_params["size_high"] = int(thumb_info["size_high"])
+    template_params["size_low"] = int(thumb_info["size_low"])
 
     # Check if we couldn't capture uploader info before
     if not template_params["uploader_id"]:
-        channel_id = thumb_info_document.getElementsByTagName("ch_id")
-        user_id = thumb_info_document.getElementsByTagName("user_id")
-        template_params["uploader_id"] = int(channel_id[0].firstChild.nodeValue) if channel_id else int(
-            user_id[0].firstChild.nodeValue) if user_id else None
+        channel_id = thumb_info.get("ch_id")
+        user_id = thumb_info.get("user_id")
+        template_params["uploader_id"] = int(channel_id) if channel_id else int(user_id) if user_id else None
 
     if not template_params["uploader"]:
-        channel_name = thumb_info_document.getElementsByTagName("ch_name")
-        user_nickname = thumb_info_document.getElementsByTagName("user_nickname")
-        template_params["uploader"] = channel_name[0].firstChild.nodeValue if channel_name else user_nickname[
-            0].firstChild.nodeValue if user_nickname else None
+        template_params["uploader"] = thumb_info.get("ch_name") or thumb_info.get("user_nickname")
 
     return template_params
 
@@ -1901,12 +2058,18 @@ def download_thumbnail(session: requests.Session, filename: AnyStr, template_par
     else:
         filename = replace_extension(filename, "jpg")
 
-    thumb_request = session.get(template_params["thumbnail_url"])
-    thumb_request.raise_for_status()
+    with session.get(template_params["thumbnail_url"], stream=True) as thumb_request:
+        thumb_request.raise_for_status()
 
-    with open(filename, "wb") as file:
-        for block in thumb_request.iter_content(BLOCK_SIZE):
-            file.write(block)
+        # Skip the body if an identical-length thumbnail was already written
+        thumb_len = thumb_request.headers.get("content-length")
+        if thumb_len and os.path.isfile(filename) and os.path.getsize(filename) == int(thumb_len):
+            output("Thumbnail for {0} already exists.\n".format(template_params["id"]), logging.INFO)
+            return
+
+        with open(filename, "wb") as file:
+            for block in thumb_request.iter_content(BLOCK_SIZE):
+                file.write(block)
 
     output("Finished downloading thumbnail for {0}.\n".format(template_params["id"]), logging.INFO)
 
@@ -1918,12 +2081,12 @@ def download_comments(session: requests.Session, filename: AnyStr, template_para
 
     filename = replace_extension(filename, "comments.json")
 
-    comments_post = COMMENTS_API_POST_DATA.format(template_params["thread_params"], template_params["thread_key"]).replace("\'", "\"").replace(": ", ":").replace(", ", ",")
-    session.options(COMMENTS_API, headers=API_HEADERS) # OPTIONS
+    comments_post = orjson.dumps({"params": template_params["thread_params"], "threadKey": template_params["thread_key"], "additionals": {}})
+    send_preflight(session, COMMENTS_API, COMMENTS_API, headers=API_HEADERS)
     get_comments_request = session.post(COMMENTS_API, data=comments_post, headers=API_HEADERS)
     get_comments_request.raise_for_status()
     with open(filename, "w", encoding="utf-8") as file:
-        json.dump(get_comments_request.json(), file, indent=4, ensure_ascii=False, sort_keys=True)
+        json.dump(orjson.loads(get_comments_request.content), file, indent=4, ensure_ascii=False, sort_keys=True)
 
     output("Finished downloading comments for {0}.\n".format(template_params["id"]), logging.INFO)
 
@@ -1958,7 +2121,7 @@ def login(username: str, password: str, session_cookie: str) -> requests.Session
         backoff_factor=BACKOFF_FACTOR,
         status_forcelist=(500, 502, 503, 504),
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
     session.mount("http://", adapter)
     session.mount("https://", adapter)
 
@@ -2165,7 +2328,7 @@ def main():
         for arg_item in _CMDL_OPTS.input:
             try:
                 # Test if input is a valid URL or file
-                url_mo = VALID_URL_RE.match(arg_item)
+                url_mo = VALID_URL_RE.fullmatch(arg_item)
 
                 if url_mo is None:
                     output(